@@ -1,9 +1,13 @@
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
 import gphoto2 as gp
 import usb.core
 import usb.util
+import json
 import os
+import threading
 import time
 
 
@@ -15,15 +19,135 @@ class CameraInfo(BaseModel):
     product_id: str
 
 
+class CachedFile(BaseModel):
+    mtime: int
+    size: int
+
+
+class CachedFileInfo(BaseModel):
+    """
+    Stand-in for a `CameraFileInfo` restored from the info cache; like the real
+    one it exposes `file.mtime` and `file.size`.
+    """
+
+    file: CachedFile
+
+
+def _camera_path(folder: str, name: str) -> str:
+    # Camera-side paths are always "/"-separated, independent of the host OS
+    if folder.endswith("/"):
+        return folder + name
+    return folder + "/" + name
+
+
+def _unique_local_name(folder: str, name: str, used: set) -> str:
+    # The destination is flat, but the same file name can exist in several
+    # camera folders (100CANON/IMG_0001.JPG, 101CANON/IMG_0001.JPG). On a
+    # collision the camera folder name is prefixed, then a counter.
+    prefix = os.path.basename(folder.rstrip("/"))
+    candidate = name
+    counter = 1
+    while candidate.lower() in used:
+        candidate = f"{prefix}_{name}" if counter == 1 else f"{prefix}_{counter}_{name}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
 class CameraClient:
+    def __init__(self, cache_path: Optional[str] = None):
+        """
+        - `cache_path`: optional JSON file in which the file infos seen on the
+          cameras are persisted across runs, so known files don't need to be
+          queried again
+        """
+        self._sessions: Dict[Tuple[int, int], Tuple[gp.Camera, gp.Context]] = {}
+        self._usb_desc_cache: Dict[Tuple[int, int, int, int], Tuple[str, str]] = {}
+        self._cache_path = cache_path
+        self._info_cache: Dict[str, dict] = {}
+
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self._info_cache = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable camera cache '{cache_path}': {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes all camera sessions opened by this client and persists the file
+        info cache if a `cache_path` was given.
+        """
+        for camera, context in self._sessions.values():
+            camera.exit(context)
+        self._sessions.clear()
+
+        if self._cache_path is not None:
+            os.makedirs(os.path.dirname(self._cache_path) or ".", exist_ok=True)
+            with open(self._cache_path, "w") as f:
+                json.dump(self._info_cache, f)
+
+    def _get_session(self, camera_info: CameraInfo) -> Tuple[gp.Camera, gp.Context]:
+        """
+        Returns the cached `(camera, context)` pair for `camera_info`, initializing
+        the camera on first use. The session stays open until `close()` is called.
+        """
+        key = (camera_info.bus, camera_info.device)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        context = gp.Context()
+        camera = self._open(camera_info, context)
+
+        self._sessions[key] = (camera, context)
+        return camera, context
+
+    def _open(self, camera_info: CameraInfo, context: gp.Context) -> gp.Camera:
+        """
+        Opens the camera on the USB port described by `camera_info` directly,
+        without scanning the bus again via `gp.Camera.autodetect()`.
+        """
+        port_info_list = gp.PortInfoList()
+        port_info_list.load()
+        idx = port_info_list.lookup_path(
+            f"usb:{camera_info.bus:03d},{camera_info.device:03d}"
+        )
+
+        camera = gp.Camera()
+        camera.set_port_info(port_info_list[idx])
+        camera.init(context)
+        return camera
+
+    def _get_usb_descriptors(self, dev) -> Tuple[str, str]:
+        """
+        Returns the `(manufacturer, product)` strings of a USB device. Each lookup is
+        a control transfer, so the results are cached per device.
+        """
+        key = (dev.bus, dev.address, dev.idVendor, dev.idProduct)
+        cached = self._usb_desc_cache.get(key)
+        if cached is not None:
+            return cached
+
+        manufacturer = usb.util.get_string(dev, dev.iManufacturer) or "Unknown"
+        product = usb.util.get_string(dev, dev.iProduct) or "Unknown"
+
+        self._usb_desc_cache[key] = (manufacturer, product)
+        return manufacturer, product
 
     def list_connected_cameras(self) -> List[CameraInfo]:
         cameras = gp.Camera.autodetect()
-        camera_list: List[CameraInfo] = []
 
-        for idx, (_name, port) in enumerate(cameras):
+        def _probe(idx_name_port) -> Optional[CameraInfo]:
+            idx, (_name, port) = idx_name_port
             if not port.startswith("usb:"):
-                continue
+                return None
 
             try:
                 bus_str, dev_str = port[4:].split(",")
@@ -31,93 +155,164 @@ class CameraClient:
                 device = int(dev_str)
 
                 dev = usb.core.find(bus=bus, address=device)
-                if dev is not None:
-                    manufacturer = (
-                        usb.util.get_string(dev, dev.iManufacturer) or "Unknown"
-                    )
-                    product = usb.util.get_string(dev, dev.iProduct) or "Unknown"
-
-                    camera_list.append(
-                        CameraInfo(
-                            index=idx,
-                            bus=bus,
-                            device=device,
-                            manufacturer_id=manufacturer,
-                            product_id=product,
-                        )
-                    )
+                if dev is None:
+                    return None
+
+                manufacturer, product = self._get_usb_descriptors(dev)
+                return CameraInfo(
+                    index=idx,
+                    bus=bus,
+                    device=device,
+                    manufacturer_id=manufacturer,
+                    product_id=product,
+                )
             except Exception as e:
                 print(f"Error processing camera at port '{port}': {e}")
+                return None
 
-        return camera_list
+        # Query the descriptors of all cameras concurrently, capped so the bus
+        # isn't flooded with control transfers
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(_probe, enumerate(cameras)))
 
-    def list_files(self, camera_info: CameraInfo) -> List[str]:
-        cameras = gp.Camera.autodetect()
-        if camera_info.index >= len(cameras):
-            raise IndexError("Camera index out of range")
+        return [info for info in results if info is not None]
 
-        camera = gp.Camera()
-        context = gp.Context()
-        camera.init(context)
+    def list_files(self, camera_info: CameraInfo) -> List[str]:
+        camera, _ = self._get_session(camera_info)
 
-        def _list_files_in_folder(path: str) -> List[str]:
-            result = []
+        result = []
+        queue = deque(["/"])
+        while queue:
+            path = queue.popleft()
             for name, _ in camera.folder_list_files(path):
-                result.append(os.path.join(path, name))
+                result.append(_camera_path(path, name))
             for name, _ in camera.folder_list_folders(path):
-                result.extend(_list_files_in_folder(os.path.join(path, name)))
-            return result
+                queue.append(_camera_path(path, name))
+        return result
 
-        try:
-            return _list_files_in_folder("/")
-        finally:
-            camera.exit(context)
+    def _cache_identity(
+        self, camera_info: CameraInfo, camera: gp.Camera
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Returns `(cache_key, storage_fingerprint)` for the camera, or None if it
+        can't be identified reliably, in which case the info cache is not used.
 
-    def list_images(self, camera_info: CameraInfo) -> Dict[str, object]:
+        The key names the physical body via its serial number. The fingerprint
+        covers label and capacity of every storage to detect a card swap; changes
+        within a card are detected per folder by `_trusted_folder_cache()`.
         """
-        Returns a dict mapping each file-path on the camera (e.g. "/DCIM/100CANON/IMG_0001.JPG")
-        to its `CameraFileInfo` object (the return value of camera.file_get_info(...)).
+        try:
+            serial = camera.get_single_config("serialnumber").get_value()
+            storages = camera.get_storageinfo()
+        except gp.GPhoto2Error:
+            return None
+        if not serial or not storages:
+            return None
+
+        cache_key = f"{camera_info.manufacturer_id}/{camera_info.product_id}/{serial}"
+        fingerprint = "|".join(
+            f"{storage.label}:{storage.capacitykbytes}" for storage in storages
+        )
+        return cache_key, fingerprint
+
+    def _trusted_folder_cache(
+        self, camera: gp.Camera, folder: str, names: List[str], cached: Dict[str, dict]
+    ) -> Dict[str, dict]:
         """
-        cameras = gp.Camera.autodetect()
-        if camera_info.index >= len(cameras):
-            raise IndexError("Camera index out of range")
-
-        camera = gp.Camera()
-        context = gp.Context()
-        camera.init(context)
-
-        images: Dict[str, object] = {}
+        Returns the cached `{name: entry}` infos of `folder` if they still describe
+        the files on the camera, otherwise an empty dict.
+
+        New captures only add names, so the cached names must be a subset of the
+        current listing; a missing name means files were deleted or the card was
+        formatted. If the camera reset its file numbering after a format, the
+        cached names reappear with new content, which shows up as a changed
+        mtime/size when re-querying one of them.
+        """
+        if not cached or not set(cached) <= set(names):
+            return {}
 
-        def _recurse_and_collect(path: str):
-            for fname, _ in camera.folder_list_files(path):
-                fullpath = os.path.join(path, fname)
-                info = camera.file_get_info(path, fname)
-                images[fullpath] = info
+        probe = min(cached)
+        info = camera.file_get_info(folder, probe)
+        if {"mtime": info.file.mtime, "size": info.file.size} != cached[probe]:
+            return {}
+        return cached
 
+    def _walk(self, camera_info: CameraInfo) -> Iterator[Tuple[str, str, object]]:
+        """
+        Walks the camera's folder tree breadth-first, yielding a `(folder, name, info)`
+        tuple for every file. `info` is its `CameraFileInfo`, or a `CachedFileInfo`
+        if the file was already seen in an earlier walk and its folder is unchanged
+        apart from new files.
+        """
+        camera, _ = self._get_session(camera_info)
+        identity = self._cache_identity(camera_info, camera)
+
+        cached: Dict[str, Dict[str, dict]] = {}
+        if identity is not None:
+            cache_key, fingerprint = identity
+            entry = self._info_cache.get(cache_key)
+            if isinstance(entry, dict) and entry.get("storage") == fingerprint:
+                cached = entry.get("folders", {})
+        seen: Dict[str, Dict[str, dict]] = {}
+
+        queue = deque(["/"])
+        while queue:
+            path = queue.popleft()
+            names = [fname for fname, _ in camera.folder_list_files(path)]
+            folder_cache = self._trusted_folder_cache(
+                camera, path, names, cached.get(path, {})
+            )
+            folder_seen = seen.setdefault(path, {})
+            for fname in names:
+                entry = folder_cache.get(fname)
+                if entry is not None:
+                    info = CachedFileInfo(file=CachedFile(**entry))
+                else:
+                    info = camera.file_get_info(path, fname)
+                    entry = {"mtime": info.file.mtime, "size": info.file.size}
+                folder_seen[fname] = entry
+                yield path, fname, info
             for subfolder, _ in camera.folder_list_folders(path):
-                _recurse_and_collect(os.path.join(path, subfolder))
+                queue.append(_camera_path(path, subfolder))
 
-        try:
-            _recurse_and_collect("/")
-            return images
-        finally:
-            camera.exit(context)
+        # Only a complete walk knows which files are gone from the camera
+        if identity is not None:
+            self._info_cache[cache_key] = {"storage": fingerprint, "folders": seen}
 
-    def list_new_files(self, camera_info: CameraInfo, days: int) -> Dict[str, object]:
+    def _iter_new_files(
+        self, camera_info: CameraInfo, days: int
+    ) -> Iterator[Tuple[str, str, object]]:
         """
-        Returns a dictionary of all files whose `mtime` (camera-side modification time)
-        is within the last `days` days. Uses `list_images()` internally.
+        Yields the `(folder, name, info)` tuples of all files whose `mtime` is within
+        the last `days` days.
         """
-        all_images = self.list_images(camera_info)
         cutoff = time.time() - (days * 86400)
 
-        new_files: Dict[str, object] = {}
-        for path, info in all_images.items():
+        for folder, name, info in self._walk(camera_info):
             # info.file.mtime is a time_t (seconds since epoch)
             if hasattr(info, "file") and getattr(info.file, "mtime", 0) >= cutoff:
-                new_files[path] = info
+                yield folder, name, info
 
-        return new_files
+    def list_images(self, camera_info: CameraInfo) -> Dict[str, object]:
+        """
+        Returns a dict mapping each file-path on the camera (e.g. "/DCIM/100CANON/IMG_0001.JPG")
+        to its `CameraFileInfo` object (the return value of camera.file_get_info(...)),
+        or the `CachedFileInfo` remembered for it.
+        """
+        return {
+            _camera_path(folder, name): info
+            for folder, name, info in self._walk(camera_info)
+        }
+
+    def list_new_files(self, camera_info: CameraInfo, days: int) -> Dict[str, object]:
+        """
+        Returns a dictionary of all files whose `mtime` (camera-side modification time)
+        is within the last `days` days.
+        """
+        return {
+            _camera_path(folder, name): info
+            for folder, name, info in self._iter_new_files(camera_info, days)
+        }
 
     def download_new_files(
         self, camera_info: CameraInfo, days: int, destination: str
@@ -130,41 +325,50 @@ class CameraClient:
         - `days`: look for files whose mtime is within the last `days` days
         - `destination`: local folder where files will be saved (flat structure)
         """
-        # 1) Gather all new files on the camera
-        new_files = self.list_new_files(camera_info, days)
+        # 1) Gather all new files on the camera in a single walk. The walk is
+        #    finished before downloading so it never competes for the camera.
+        new_files = list(self._iter_new_files(camera_info, days))
         if not new_files:
             return []
 
         # 2) Make sure destination folder exists
         os.makedirs(destination, exist_ok=True)
 
-        # 3) Open the camera
-        cameras = gp.Camera.autodetect()
-        if camera_info.index >= len(cameras):
-            raise IndexError("Camera index out of range")
+        # 3) Pick a distinct local path per file before any download starts, so
+        #    no two workers ever write the same file
+        used_names: set = set()
+        jobs = []
+        for folder, name, _info in new_files:
+            local_name = _unique_local_name(folder, name, used_names)
+            jobs.append((folder, name, os.path.join(destination, local_name)))
 
-        camera = gp.Camera()
-        context = gp.Context()
-        camera.init(context)
+        # 4) Reuse the camera session opened while listing
+        camera, _ = self._get_session(camera_info)
 
-        downloaded_paths: List[str] = []
+        # libgphoto2 sessions are not thread-safe, so only one transfer may talk
+        # to the camera at a time; writing the files to disk runs concurrently.
+        cam_lock = threading.Lock()
 
-        try:
-            for cam_path, info in new_files.items():
-                # cam_path is something like "/DCIM/100CANON/IMG_0001.JPG"
-                folder, name = os.path.split(cam_path)
-
-                # Retrieve the file data from the camera
+        def fetch(folder: str, name: str, local_path: str) -> str:
+            # Retrieve the file data from the camera
+            with cam_lock:
                 gp_file = camera.file_get(folder, name, gp.GP_FILE_TYPE_NORMAL)
 
-                # Local path to write to
-                local_path = os.path.join(destination, name)
+            # Write the buffer in one go into a preallocated file, no fsync
+            data = memoryview(gp_file.get_data_and_size())
+            fd = os.open(local_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                if hasattr(os, "posix_fallocate") and len(data):
+                    os.posix_fallocate(fd, 0, len(data))
+                while data:
+                    written = os.write(fd, data)
+                    data = data[written:]
+            finally:
+                os.close(fd)
 
-                # Save and record
-                gp_file.save(local_path)
-                downloaded_paths.append(local_path)
+            return local_path
 
-            return downloaded_paths
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            downloaded_paths = list(executor.map(lambda job: fetch(*job), jobs))
 
-        finally:
-            camera.exit(context)
+        return downloaded_paths
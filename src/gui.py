@@ -1,19 +1,60 @@
 import tkinter as tk
 from tkinter import ttk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from PIL import Image, ImageTk
+import hashlib
+import mmap
+import tempfile
 import rawpy
 import os
 
+# libvips is optional: when present, JPEG/TIFF thumbnails are made with its
+# shrink-on-load + SIMD resampling. Installing pillow-simd instead of pillow
+# speeds up the PIL fallback path in a similar way without code changes.
+try:
+    import pyvips
+    HAVE_VIPS = True
+except ImportError:
+    HAVE_VIPS = False
+
+# Raw formats that embed a JPEG preview, which is used instead of demosaicing
+RAW_EXTS = {
+    ".nef", ".cr2", ".cr3", ".arw", ".raf", ".dng", ".orf", ".rw2",
+    ".pef", ".rwl", ".3fr", ".iiq", ".x3f", ".srw", ".erf", ".gpr",
+}
+
+
+# Thumbnails are keyed by content: name, size and the first bytes of the file
+# (which hold the EXIF header), so re-downloads into a new directory still hit
+THUMB_KEY_HEAD_BYTES = 64 * 1024
+# Once the disk cache grows beyond this, the least recently used entries go
+THUMB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
 
 class ImageSelectionDialog:
     def __init__(self, images, preselected=None):
-        self.images = images
+        self.images = list(images)
         self.preselected = set(preselected) if preselected else set()
-        self.selected = set(self.preselected)
-        self.image_refs = {}
+        # Selection is a bitmap indexed by position in self.images
+        self._path_to_idx = {p: i for i, p in enumerate(self.images)}
+        self._bits = bytearray((len(self.images) + 7) // 8)
+        for path in self.preselected:
+            idx = self._path_to_idx.get(path)
+            if idx is not None:
+                self._bits[idx >> 3] |= 1 << (idx & 7)
+        # LRU of the PhotoImages currently shown, see _reflow_visible()
+        self.image_refs: OrderedDict[str, ImageTk.PhotoImage] = OrderedDict()
+        self._labels = {}
+        self._frames = []
+        self._pending = set()
+        self._failed = set()
         self.thumb_size = (250, 250)
         self.columns = None      # will be set on the first draw
         self._resize_job = None
+        self._pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        self._cache_dir = Path.home() / ".cache/flare/thumbs"
 
     def show(self):
         self.root = tk.Tk()
@@ -37,7 +78,14 @@ class ImageSelectionDialog:
         )
 
         self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
+        self._scrollbar = scrollbar
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+
+        # Scroll with the mouse wheel (<Button-4/5> on X11)
+        # macOS reports small deltas, so only the direction is used
+        self.canvas.bind_all("<MouseWheel>", lambda e: self.canvas.yview_scroll(-1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind_all("<Button-4>", lambda e: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind_all("<Button-5>", lambda e: self.canvas.yview_scroll(1, "units"))
 
         self.canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -56,14 +104,16 @@ class ImageSelectionDialog:
         submit_btn.pack(pady=5)
 
         self.root.mainloop()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._prune_cache()
         self.root.destroy()
-        return list(self.selected)
+        return [
+            path
+            for idx, path in enumerate(self.images)
+            if self._bits[idx >> 3] & (1 << (idx & 7))
+        ]
 
     def _draw_images(self, initial=False):
-        # Clear previous widgets
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
         # Determine available width for thumbnails
         canvas_width = self.canvas.winfo_width()
         if canvas_width < self.thumb_size[0] + 20:
@@ -73,63 +123,227 @@ class ImageSelectionDialog:
         # Compute how many columns fit
         new_columns = max(1, canvas_width // (self.thumb_size[0] + 20))
 
-        # If this is NOT the initial draw, and the column count didn't change, skip redraw
-        if not initial and new_columns == self.columns:
+        if initial:
+            self._build_frames_once()
+        elif new_columns == self.columns:
+            # Column count didn't change, nothing to reflow
             return
 
-        self.columns = new_columns
+        self._reflow(new_columns)
 
-        for idx, path in enumerate(self.images):
-            row = idx // self.columns
-            col = idx % self.columns
+    def _build_frames_once(self):
+        # Creates one frame per image; a resize merely moves the existing
+        # frames around in _reflow(). Thumbnails are loaded on demand by
+        # _reflow_visible() once a frame scrolls into view.
+        self._placeholder = ImageTk.PhotoImage(
+            Image.new("RGB", self.thumb_size, "gray")
+        )
 
+        for path in self.images:
             frame = tk.Frame(self.scrollable_frame, highlightthickness=3, bd=2)
-            frame.grid(row=row, column=col, padx=10, pady=10, sticky="n")
+            self._frames.append(frame)
 
-            # Load NEF via rawpy or normal image via PIL
-            try:
-                if path.lower().endswith(".nef"):
-                    with rawpy.imread(path) as raw:
-                        thumb = raw.extract_thumb()
-                        if thumb.format == rawpy.ThumbFormat.JPEG:
-                            from io import BytesIO
-                            img_data = BytesIO(thumb.data)
-                            img = Image.open(img_data)
-                        else:
-                            img = Image.fromarray(thumb.data)
-                else:
-                    img = Image.open(path)
-                img.thumbnail(self.thumb_size)
-                photo = ImageTk.PhotoImage(img)
-            except Exception as e:
-                print(f"Failed to load {path}: {e}")
-                continue
-
-            self.image_refs[path] = photo
-            label = tk.Label(frame, image=photo)
+            # Show a placeholder until the thumbnail has been loaded in the background.
+            # The label keeps the full thumb_size box (width/height are pixels when
+            # showing an image), so every row has the same height whatever the
+            # orientation of its thumbnails; _visible_rows() relies on that.
+            label = tk.Label(
+                frame,
+                image=self._placeholder,
+                width=self.thumb_size[0],
+                height=self.thumb_size[1],
+            )
             label.pack()
             label.bind("<Button-1>", lambda e, f=frame, p=path: self._toggle(f, p))
+            self._labels[path] = label
 
             # Initial border color based on preselection
-            if path in self.selected:
+            if self._is_selected(path):
                 frame.config(highlightbackground="blue")
             else:
                 frame.config(highlightbackground="gray")
 
-    def _toggle(self, frame, path):
-        if path in self.selected:
-            self.selected.remove(path)
-            frame.config(highlightbackground="gray")
+    def _reflow(self, columns):
+        self.columns = columns
+        for idx, frame in enumerate(self._frames):
+            row = idx // self.columns
+            col = idx % self.columns
+            frame.grid(row=row, column=col, padx=10, pady=10, sticky="n")
+
+        self.root.update_idletasks()
+        self._reflow_visible()
+
+    def _visible_rows(self):
+        # Rows overlapping the viewport, plus one row of look-ahead on each side
+        row_height = self._frames[0].winfo_reqheight() + 20  # pady above and below
+        top = self.canvas.canvasy(0)
+        first = int(top // row_height) - 1
+        last = int((top + self.canvas.winfo_height()) // row_height) + 1
+        return max(0, first), last
+
+    def _reflow_visible(self):
+        if not self._frames or self.columns is None:
+            return
+
+        first, last = self._visible_rows()
+        start = first * self.columns
+        end = min(len(self.images), (last + 1) * self.columns)
+
+        # Keep a few screens worth of thumbnails around so scrolling back is cheap
+        self._max_refs = 4 * self.columns * (last - first + 1)
+
+        for path in self.images[start:end]:
+            if path in self.image_refs:
+                self.image_refs.move_to_end(path)
+            elif path not in self._pending and path not in self._failed:
+                self._pending.add(path)
+                fut = self._pool.submit(self._load_thumb, path)
+                fut.add_done_callback(
+                    lambda f, lbl=self._labels[path], p=path: self._on_thumb_done(lbl, p, f)
+                )
+
+    def _on_scroll(self, first, last):
+        self._scrollbar.set(first, last)
+        self._reflow_visible()
+
+    def _load_thumb(self, path):
+        with open(path, "rb") as f:
+            head = f.read(THUMB_KEY_HEAD_BYTES)
+            size = os.fstat(f.fileno()).st_size
+        key = hashlib.sha1(
+            f"{os.path.basename(path)}:{size}:{self.thumb_size}:".encode() + head
+        ).hexdigest()
+        cache_path = self._cache_dir / f"{key}.png"
+
+        if cache_path.exists():
+            try:
+                with Image.open(cache_path) as img:
+                    img.load()
+            except (OSError, ValueError, SyntaxError):
+                # Broken cache entry, drop it and generate the thumbnail again
+                cache_path.unlink(missing_ok=True)
+            else:
+                # Touch the entry so _prune_cache() sees it as recently used
+                os.utime(cache_path)
+                return img
+
+        img = self._make_thumb(path)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+
+        # Write to a temporary file first so an interrupted save never leaves
+        # a truncated PNG behind under the final name
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, format="PNG")
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return img
+
+    def _prune_cache(self):
+        # Evict the least recently used thumbnails until the cache fits its budget;
+        # temporary files left behind by interrupted saves count as old entries
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self._cache_dir)
+                if entry.name.endswith((".png", ".tmp"))
+            ]
+        except FileNotFoundError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= THUMB_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _make_thumb(self, path):
+        # Load raw files via rawpy or normal image via PIL
+        if os.path.splitext(path)[1].lower() in RAW_EXTS:
+            with rawpy.imread(path) as raw:
+                thumb = raw.extract_thumb()
+                if thumb.format == rawpy.ThumbFormat.JPEG:
+                    from io import BytesIO
+                    img_data = BytesIO(thumb.data)
+                    img = Image.open(img_data)
+                else:
+                    img = Image.fromarray(thumb.data)
+            img.thumbnail(self.thumb_size)
+        elif HAVE_VIPS and path.lower().endswith((".jpg", ".jpeg", ".tif", ".tiff")):
+            v = pyvips.Image.thumbnail(path, self.thumb_size[0], height=self.thumb_size[1])
+            if v.interpretation != "srgb":
+                v = v.colourspace("srgb")
+            mode = "RGBA" if v.bands == 4 else "RGB"
+            img = Image.frombytes(mode, (v.width, v.height), v.write_to_memory())
         else:
-            self.selected.add(path)
+            # Decode straight from the page cache; the mapping is passed as a
+            # file object (not copied into a BytesIO) so no extra copy is made.
+            # Let libjpeg downscale while decoding; thumbnail() only has to
+            # resize the remaining small image, so bicubic is good enough
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                img = Image.open(mm)
+                img.draft("RGB", self.thumb_size)
+                img.load()
+            img.thumbnail(self.thumb_size, Image.BICUBIC)
+        return img
+
+    def _on_thumb_done(self, label, path, fut):
+        # Called from a worker thread; hand the result over to the Tk thread
+        if fut.cancelled():
+            return
+        try:
+            self.root.after(0, lambda: self._show_thumb(label, path, fut))
+        except (RuntimeError, tk.TclError):
+            # The dialog was closed while the thumbnail was loading
+            pass
+
+    def _show_thumb(self, label, path, fut):
+        # Runs on the Tk thread; the label is gone if the dialog was torn down
+        self._pending.discard(path)
+        if not label.winfo_exists():
+            return
+
+        try:
+            photo = ImageTk.PhotoImage(fut.result())
+        except Exception as e:
+            print(f"Failed to load {path}: {e}")
+            self._failed.add(path)
+            return
+
+        self.image_refs[path] = photo
+        label.configure(image=photo)
+
+        # Free the least recently shown thumbnails, their frames fall back to the placeholder
+        while len(self.image_refs) > self._max_refs:
+            old_path, _ = self.image_refs.popitem(last=False)
+            self._labels[old_path].configure(image=self._placeholder)
+
+    def _is_selected(self, path):
+        idx = self._path_to_idx[path]
+        return bool(self._bits[idx >> 3] & (1 << (idx & 7)))
+
+    def _toggle(self, frame, path):
+        idx = self._path_to_idx[path]
+        self._bits[idx >> 3] ^= 1 << (idx & 7)
+        if self._is_selected(path):
             frame.config(highlightbackground="blue")
+        else:
+            frame.config(highlightbackground="gray")
 
     def _on_root_resize(self, event):
-        # Debounce: only redraw 100ms after the last resize event
-        #if self._resize_job:
-        #    self.root.after_cancel(self._resize_job)
-        #self._resize_job = self.root.after(100, lambda: self._draw_images(initial=False))
-        pass
+        # Debounce: only reflow 150ms after the last resize event
+        if self._resize_job:
+            self.root.after_cancel(self._resize_job)
+        self._resize_job = self.root.after(150, lambda: self._draw_images(initial=False))
 
     def _center_window(self):
         w, h = 900, 600
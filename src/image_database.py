@@ -1,14 +1,109 @@
+import io
 import os
-import json
+import math
+import hashlib
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Optional
-from concurrent.futures import ThreadPoolExecutor
 
-from pydantic import BaseModel
-import exiftool
+from pydantic import BaseModel, PrivateAttr
+from PIL import Image
+from PIL.TiffImagePlugin import ImageFileDirectory_v2
+
+# EXIF tag ids, see https://exiftool.org/TagNames/EXIF.html
+EXIF_IFD_POINTER = 0x8769
+TAG_EXPOSURE_TIME = 0x829A
+TAG_FNUMBER = 0x829D
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_FOCAL_LENGTH = 0x920A
+TAG_MAKER_NOTE = 0x927C
+TAG_WHITE_BALANCE = 0xA403
+
+# Nikon makernote, see https://exiftool.org/TagNames/Nikon.html
+NIKON_MAKER_NOTE_HEADER = b"Nikon\x00\x02"
+NIKON_TAG_LENS_TYPE = 0x0083
+NIKON_TAG_LENS = 0x0084
+
+TAG_XML_PACKET = 0x02BC
+
+XMP_RATING_ELEMENT = b"<xmp:Rating>"
+XMP_RATING_ATTRIBUTE = b'xmp:Rating="'
+# For files Pillow can't parse, only this much of the file head is searched
+XMP_SEARCH_BYTES = 1024 * 1024
+
+
+def _read_xmp_rating(data) -> int:
+    # The rating lives in the XMP packet, either as element or as attribute
+    start = data.find(XMP_RATING_ELEMENT)
+    if start != -1:
+        start += len(XMP_RATING_ELEMENT)
+        end = data.find(b"<", start)
+    else:
+        start = data.find(XMP_RATING_ATTRIBUTE)
+        if start == -1:
+            return 0
+        start += len(XMP_RATING_ATTRIBUTE)
+        end = data.find(b'"', start)
+
+    try:
+        return int(data[start:end])
+    except ValueError:
+        return 0
+
+
+def _format_number(value) -> str:
+    # exiftool -n prints rationals with up to 10 significant digits
+    value = float(value)
+    if not math.isfinite(value):
+        return "undef"
+    return f"{value:.10g}"
+
+
+def _round_rational(value) -> float:
+    # Same rounding as _format_number, so values match rows stored via exiftool
+    return float(f"{float(value):.10g}")
+
+
+def _read_lens_spec(maker_note) -> str:
+    """
+    Returns the value exiftool reports as `Composite:LensSpec` (with `-n`): the
+    Nikon makernote Lens and LensType tags joined, e.g. "24 70 2.8 2.8 14".
+    Other makes have no LensSpec, for them this is "".
+    """
+    if not isinstance(maker_note, bytes) or not maker_note.startswith(
+        NIKON_MAKER_NOTE_HEADER
+    ):
+        return ""
+
+    # The makernote embeds its own TIFF header, offsets are relative to it
+    tiff = maker_note[10:]
+    try:
+        ifd = ImageFileDirectory_v2(tiff[:8])
+        fp = io.BytesIO(tiff)
+        fp.seek(ifd.next)
+        ifd.load(fp)
+        lens = ifd[NIKON_TAG_LENS]
+        lens_type = ifd[NIKON_TAG_LENS_TYPE]
+    except (KeyError, ValueError, SyntaxError, EOFError):
+        return ""
+
+    if isinstance(lens_type, bytes):
+        lens_type = lens_type[0]
+    return " ".join([_format_number(value) for value in lens] + [str(lens_type)])
+
+
+def _load_or_none(path: str) -> Optional["ImageMetadata"]:
+    # Module level so it can be pickled into the process pool of load_many()
+    try:
+        return ImageMetadata.load(path)
+    except Exception as e:
+        print(f"Failed to load {path}: {e}")
+        return None
 
 
 class ImageMetadata(BaseModel):
+    model_config = {"extra": "forbid", "validate_assignment": False}
+
     file_name: str
     rating: int
     aperture: float
@@ -18,30 +113,100 @@ class ImageMetadata(BaseModel):
     exposure_time: float
     color_temperature: int
 
+    @property
+    def content_hash(self) -> bytes:
+        """
+        Digest over all capture fields (everything but the file name), which
+        together identify a capture independent of how the file was named.
+        """
+        # Normalize the types, instances built via model_construct() may
+        # e.g. hold an int where the field is a float
+        key = (
+            f"{int(self.rating)}|{float(self.aperture)}|{str(self.lens_id)}|"
+            f"{str(self.capture_time)}|{float(self.focal_length)}|"
+            f"{float(self.exposure_time)}|{int(self.color_temperature)}"
+        )
+        return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
     @staticmethod
     def load(path: str):
-        with exiftool.ExifTool() as et:
-            output = et.execute(b"-j", path.encode())
-            metadata = json.loads(output)[0]
+        rating = 0
+        exif = Image.Exif()
 
-        return ImageMetadata(
+        with open(path, "rb") as f:
+            # Only the header is parsed here, the image data is never decoded.
+            # Files Pillow can't read (videos, CR3, HEIF, ...) keep the
+            # default values, like exiftool reporting no tags for them.
+            try:
+                with Image.open(f) as img:
+                    exif = img.getexif()
+                    # XMP packet from the JPEG APP1 segment or TIFF/NEF tag 700
+                    xmp = img.info.get("xmp") or exif.get(TAG_XML_PACKET)
+            except (OSError, ValueError, SyntaxError):
+                f.seek(0)
+                xmp = f.read(XMP_SEARCH_BYTES)
+
+        if xmp:
+            if isinstance(xmp, str):
+                xmp = xmp.encode()
+            rating = _read_xmp_rating(xmp)
+
+        exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+
+        # The values are already converted to the field types here, so
+        # pydantic's validation is skipped
+        return ImageMetadata.model_construct(
             file_name=os.path.basename(path),
-            rating=int(metadata.get("XMP:Rating", 0)),
-            aperture=float(metadata.get("EXIF:FNumber", 0.0)),
-            lens_id=str(metadata.get("Composite:LensSpec", "")),
-            capture_time=str(metadata.get("EXIF:DateTimeOriginal", "")),
-            focal_length=float(metadata.get("EXIF:FocalLength", 0.0)),
-            exposure_time=float(metadata.get("EXIF:ExposureTime", 0.0)),
-            color_temperature=int(metadata.get("EXIF:WhiteBalance", 0)),
+            rating=rating,
+            aperture=_round_rational(exif_ifd.get(TAG_FNUMBER, 0.0)),
+            lens_id=_read_lens_spec(exif_ifd.get(TAG_MAKER_NOTE)),
+            capture_time=str(exif_ifd.get(TAG_DATETIME_ORIGINAL, "")),
+            focal_length=_round_rational(exif_ifd.get(TAG_FOCAL_LENGTH, 0.0)),
+            exposure_time=_round_rational(exif_ifd.get(TAG_EXPOSURE_TIME, 0.0)),
+            color_temperature=int(exif_ifd.get(TAG_WHITE_BALANCE, 0)),
         )
 
+    @staticmethod
+    def load_many(paths: List[str]) -> List[Optional["ImageMetadata"]]:
+        """
+        Loads the metadata of all `paths`, returned in the same order as `paths`.
+        Files that fail to load are reported and yield None instead.
+        Parsing is CPU-bound, so the files are spread over a process pool.
+        """
+        if len(paths) < 2:
+            return [_load_or_none(path) for path in paths]
+
+        workers = os.cpu_count() or 1
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pp:
+            return list(pp.map(_load_or_none, paths, chunksize=chunksize))
+
 
 class ImageDatabase(BaseModel):
     database_path: str
 
+    # Opened once per instance and reused by all methods until `close()`
+    _conn: sqlite3.Connection = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._conn = self.connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
     def connect(self):
         conn = sqlite3.connect(self.database_path)
         cursor = conn.cursor()
+        # Pragmas must be set before the migration below opens a transaction
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS images (
@@ -52,85 +217,94 @@ class ImageDatabase(BaseModel):
                 capture_time TEXT,
                 focal_length REAL,
                 exposure_time REAL,
-                color_temperature INTEGER
+                color_temperature INTEGER,
+                content_hash BLOB
             )
         """
         )
+        self._add_content_hash_column(cursor)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_hash ON images(content_hash)")
         conn.commit()
         return conn
 
-    def add(self, image_data: List[ImageMetadata]):
-        conn = self.connect()
-        cursor = conn.cursor()
-        for img in image_data:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO images (
-                    file_name, rating, aperture, lens_id, capture_time,
-                    focal_length, exposure_time, color_temperature
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+    def _add_content_hash_column(self, cursor: sqlite3.Cursor):
+        # Databases created before content_hash existed get the column and
+        # have it filled in for all rows already stored
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(images)")}
+        if "content_hash" in columns:
+            return
+
+        cursor.execute("ALTER TABLE images ADD COLUMN content_hash BLOB")
+        rows = cursor.execute(
+            """
+            SELECT file_name, rating, aperture, lens_id, capture_time,
+                   focal_length, exposure_time, color_temperature
+            FROM images
+            """
+        ).fetchall()
+        cursor.executemany(
+            "UPDATE images SET content_hash = ? WHERE file_name = ?",
+            (
                 (
-                    img.file_name,
-                    img.rating,
-                    img.aperture,
-                    img.lens_id,
-                    img.capture_time,
-                    img.focal_length,
-                    img.exposure_time,
-                    img.color_temperature,
-                ),
+                    ImageMetadata.model_construct(
+                        file_name=row[0],
+                        rating=row[1],
+                        aperture=row[2],
+                        lens_id=row[3],
+                        capture_time=row[4],
+                        focal_length=row[5],
+                        exposure_time=row[6],
+                        color_temperature=row[7],
+                    ).content_hash,
+                    row[0],
+                )
+                for row in rows
+            ),
+        )
+
+    def add(self, image_data: List[ImageMetadata]):
+        cursor = self._conn.cursor()
+        rows = (
+            (
+                img.file_name,
+                img.rating,
+                img.aperture,
+                img.lens_id,
+                img.capture_time,
+                img.focal_length,
+                img.exposure_time,
+                img.color_temperature,
+                img.content_hash,
             )
-        conn.commit()
-        conn.close()
+            for img in image_data
+        )
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO images (
+                file_name, rating, aperture, lens_id, capture_time,
+                focal_length, exposure_time, color_temperature, content_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+        self._conn.commit()
 
     def contains(self, image_data: ImageMetadata) -> bool:
-        conn = self.connect()
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         cursor.execute(
-            """
-            SELECT 1 FROM images
-            WHERE rating = ?
-              AND aperture = ?
-              AND lens_id = ?
-              AND capture_time = ?
-              AND focal_length = ?
-              AND exposure_time = ?
-              AND color_temperature = ?
-            """,
-            (
-                image_data.rating,
-                image_data.aperture,
-                image_data.lens_id,
-                image_data.capture_time,
-                image_data.focal_length,
-                image_data.exposure_time,
-                image_data.color_temperature,
-            ),
+            "SELECT 1 FROM images WHERE content_hash = ? LIMIT 1",
+            (image_data.content_hash,),
         )
         result = cursor.fetchone()
-        conn.close()
         return result is not None
 
     def clear(self):
-        conn = self.connect()
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         cursor.execute("DELETE FROM images")
-        conn.commit()
-        conn.close()
+        self._conn.commit()
 
-    def rebuild(self, image_paths: List[str], thread_count: Optional[int] = 4):
+    def rebuild(self, image_paths: List[str]):
         self.clear()
 
-        def process(path: str):
-            try:
-                return ImageMetadata.load(path)
-            except Exception as e:
-                print(f"Failed to load {path}: {e}")
-                return None
-
-        with ThreadPoolExecutor(max_workers=thread_count) as executor:
-            results = list(executor.map(process, image_paths))
-
-        metadata_list = [md for md in results if md is not None]
-        self.add(metadata_list)
+        metadata_list = ImageMetadata.load_many(image_paths)
+        self.add([md for md in metadata_list if md is not None])
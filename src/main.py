@@ -6,27 +6,27 @@ from image_database import ImageMetadata, ImageDatabase
 from gui import ImageSelectionDialog
 
 DAYS_SINCE_SYNC = 2
+CAMERA_CACHE_PATH = os.path.expanduser("~/.cache/flare/camera_info.json")
 
 
 def download_new_images(path, days):
-    camera_client = CameraClient()
-    cams = camera_client.list_connected_cameras()
-    download_files = camera_client.download_new_files(cams[-1], days, path)
+    with CameraClient(cache_path=CAMERA_CACHE_PATH) as camera_client:
+        cams = camera_client.list_connected_cameras()
+        download_files = camera_client.download_new_files(cams[-1], days, path)
     print(f"Downloaded {len(download_files)} files")
     return download_files
 
 
 if __name__ == "__main__":
     with tempfile.TemporaryDirectory() as tmpdir:
-        downloaded_files = {
-            x: ImageMetadata.load(x)
-            for x in download_new_images(tmpdir, DAYS_SINCE_SYNC)
-        }
+        paths = download_new_images(tmpdir, DAYS_SINCE_SYNC)
+        metas = ImageMetadata.load_many(paths)
+        downloaded_files = dict(zip(paths, metas))
 
 
         preselected_files = []
         for image, metadata in downloaded_files.items():
-            if metadata.rating > 0:
+            if metadata is not None and metadata.rating > 0:
                 print(f"## {image}")
                 preselected_files.append(image)
             else: